@@ -1,8 +1,9 @@
 import streamlit as st
 import os
+import uuid
 
 # Importar todas las funciones necesarias de los módulos refactorizados
-from utils import load_cases, get_show_results_to_students, get_user_votes
+from utils import load_cases, get_show_results_to_students, get_user_votes, warm_up
 from views import render_login_view, render_case_view, render_admin_view, render_results_view
 
 # Page configuration
@@ -14,6 +15,9 @@ st.set_page_config(
 )
 
 def main():
+    # Precalentar cachés (una sola vez por proceso)
+    warm_up()
+    
     # Inicializar estado de sesión
     if "username" not in st.session_state:
         # Intentar recuperar de query params
@@ -46,6 +50,10 @@ def main():
     if "admin_logged" not in st.session_state:
         st.session_state["admin_logged"] = False
     
+    # Token de la sesión para agrupar envíos de voto repetidos
+    if "vote_token" not in st.session_state:
+        st.session_state["vote_token"] = uuid.uuid4().hex
+    
     # Cargar casos
     cases = load_cases()
     
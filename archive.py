@@ -0,0 +1,69 @@
+import json
+import os
+import re
+from pathlib import Path
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+# Directorio por defecto para los archivos de sesiones
+ARCHIVE_DIR = 'archives'
+
+# Clave de los metadatos de Parquet donde se guardan las métricas finales
+METRICS_METADATA_KEY = b'jury_metrics'
+
+ARCHIVE_SCHEMA = pa.schema([
+    ('username', pa.dictionary(pa.int32(), pa.string())),
+    ('case_id', pa.int32()),
+    ('verdict', pa.int8()),
+    ('ts', pa.int64())
+])
+
+def archive_path(name: str, archive_dir=ARCHIVE_DIR) -> Path:
+    """Ruta del archivo de una sesión; el nombre admite alfanuméricos, guión y underscore"""
+    if not re.match(r'^[a-zA-Z0-9_-]{1,64}$', name):
+        raise ValueError("El nombre de la sesión solo puede tener caracteres alfanuméricos, guión o underscore")
+    return Path(archive_dir) / f"{name}.parquet"
+
+def write_archive(path, votes: pd.DataFrame, metrics: dict) -> Path:
+    """
+    Escribe los votos de una sesión en un archivo Parquet comprimido
+
+    Args:
+        path: Ruta del archivo a crear (no se sobrescribe uno existente)
+        votes: DataFrame con username, case_id, verdict (0/1) y ts (epoch)
+        metrics: Métricas finales de la sesión (serializables a JSON)
+
+    Returns:
+        Path: Ruta del archivo escrito
+    """
+    path = Path(path)
+    if path.exists():
+        raise FileExistsError(f"Ya existe el archivo {path}")
+    path.parent.mkdir(parents=True, exist_ok=True)
+
+    table = pa.Table.from_pandas(votes[ARCHIVE_SCHEMA.names], schema=ARCHIVE_SCHEMA, preserve_index=False)
+    table = table.replace_schema_metadata({METRICS_METADATA_KEY: json.dumps(metrics).encode('utf-8')})
+
+    # Escribir en un archivo temporal para no dejar archivos incompletos
+    tmp_path = path.with_suffix('.parquet.tmp')
+    pq.write_table(table, tmp_path, compression='zstd')
+    os.replace(tmp_path, path)
+    return path
+
+def read_archive(path, columns: list = None, filters=None) -> pa.Table:
+    """Lee los votos de un archivo con lectura mapeada en memoria"""
+    return pq.read_table(path, columns=columns, filters=filters, memory_map=True)
+
+def read_archive_metrics(path) -> dict:
+    """Lee las métricas finales guardadas en los metadatos del archivo, sin leer los votos"""
+    metadata = pq.read_schema(path, memory_map=True).metadata or {}
+    return json.loads(metadata.get(METRICS_METADATA_KEY, b'{}'))
+
+def list_archives(archive_dir=ARCHIVE_DIR) -> list:
+    """Lista los archivos de sesiones disponibles"""
+    archive_dir = Path(archive_dir)
+    if not archive_dir.is_dir():
+        return []
+    return sorted(archive_dir.glob('*.parquet'))
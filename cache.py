@@ -0,0 +1,79 @@
+import threading
+
+class _Call:
+    """Carga en curso compartida por las llamadas concurrentes de una misma clave"""
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """Agrupa las llamadas concurrentes con la misma clave en una sola ejecución"""
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Ejecuta fn una sola vez por clave; las llamadas concurrentes esperan su resultado"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+class MemoCache:
+    """
+    Caché en memoria del proceso con carga single-flight e invalidación por generación.
+    Si se indica version, la caché se invalida cuando cambia su valor (p. ej. por
+    escrituras de otro proceso).
+    """
+    def __init__(self, version=None):
+        self._lock = threading.Lock()
+        self._values = {}
+        self._generation = 0
+        self._flight = SingleFlight()
+        self._version = version
+        self._seen_version = None
+
+    def get(self, key, loader):
+        """Devuelve el valor de la clave, cargándolo con loader() si no está en caché"""
+        current_version = self._version() if self._version is not None else None
+        with self._lock:
+            if current_version != self._seen_version:
+                self._seen_version = current_version
+                self._generation += 1
+                self._values.clear()
+            if key in self._values:
+                return self._values[key]
+            generation = self._generation
+
+        value = self._flight.do((generation, key), loader)
+
+        # No guardar valores cargados antes de una invalidación
+        with self._lock:
+            if generation == self._generation:
+                self._values[key] = value
+        return value
+
+    def invalidate(self):
+        """Descarta todos los valores en caché"""
+        with self._lock:
+            self._generation += 1
+            self._values.clear()
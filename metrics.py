@@ -0,0 +1,282 @@
+import json
+
+import pandas as pd
+import numpy as np
+from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
+
+# Los veredictos se guardan como enteros en la base de datos
+VERDICT_CODES = {'innocent': 0, 'guilty': 1}
+VERDICT_LABELS = {code: label for label, code in VERDICT_CODES.items()}
+
+# Analytics and Metrics
+def count_votes(case_ids: np.ndarray, verdicts: np.ndarray):
+    """Cuenta los votos totales y los votos "culpable" (veredicto 1) por caso"""
+    case_ids, inverse = np.unique(np.asarray(case_ids), return_inverse=True)
+    total_votes = np.bincount(inverse, minlength=case_ids.size)
+    guilty_votes = np.bincount(inverse, weights=np.asarray(verdicts), minlength=case_ids.size).astype(np.int64)
+    return case_ids, total_votes, guilty_votes
+
+def agreement_stats(total_votes: np.ndarray, guilty_votes: np.ndarray) -> dict:
+    """
+    Calcula el acuerdo del jurado a partir de los conteos por caso
+    
+    Args:
+        total_votes: Número de votos por caso
+        guilty_votes: Número de votos "culpable" por caso
+        
+    Returns:
+        dict: entropía y margen por caso, kappa de Fleiss y alfa de Krippendorff
+    """
+    n = np.asarray(total_votes, dtype=np.float64)
+    g = np.asarray(guilty_votes, dtype=np.float64)
+    h = n - g
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p = g / n
+        q = 1 - p
+        entropy = np.where(p > 0, -p * np.log2(p), 0) + np.where(q > 0, -q * np.log2(q), 0)
+        margin = np.abs(g - h) / n
+    
+    # Solo los casos con al menos dos votos aportan pares de jurados
+    pairable = n >= 2
+    n, g, h = n[pairable], g[pairable], h[pairable]
+    fleiss_kappa = krippendorff_alpha = float('nan')
+    
+    if n.size:
+        # Kappa de Fleiss (generalizado a número variable de votos por caso)
+        p_agree = np.mean((g * (g - 1) + h * (h - 1)) / (n * (n - 1)))
+        p_g = g.sum() / n.sum()
+        p_chance = p_g ** 2 + (1 - p_g) ** 2
+        if p_chance < 1:
+            fleiss_kappa = float((p_agree - p_chance) / (1 - p_chance))
+        
+        # Alfa de Krippendorff nominal, a partir de la matriz de coincidencias
+        expected = g.sum() * h.sum()
+        if expected > 0:
+            observed = np.sum(g * h / (n - 1))
+            krippendorff_alpha = float(1 - (n.sum() - 1) * observed / expected)
+    
+    return {
+        'entropy': entropy,
+        'margin': margin,
+        'fleiss_kappa': fleiss_kappa,
+        'krippendorff_alpha': krippendorff_alpha
+    }
+
+def tally_metrics(case_ids, total_votes, guilty_votes, cases: list, threshold: float = 0.5) -> dict:
+    """
+    Calcula las métricas de confusión a partir de los conteos por caso
+    
+    Args:
+        case_ids: IDs de los casos
+        total_votes: Número de votos por caso
+        guilty_votes: Número de votos "culpable" por caso
+        cases: Lista de casos con su ground_truth
+        threshold: Proporción de votos "culpable" a partir de la cual se predice culpable
+        
+    Returns:
+        dict: métricas por caso (case_metrics), métricas globales y matriz de confusión
+    """
+    if len(case_ids) == 0:
+        return {
+            'case_metrics': pd.DataFrame(),
+            'accuracy': 0,
+            'precision': 0,
+            'recall': 0,
+            'f1': 0,
+            'TN': 0, 'FP': 0, 'FN': 0, 'TP': 0,
+            'fleiss_kappa': float('nan'),
+            'krippendorff_alpha': float('nan')
+        }
+    
+    case_metrics = pd.DataFrame(
+        {'total_votes': total_votes, 'guilty_votes': guilty_votes},
+        index=pd.Index(case_ids, name='case_id')
+    )
+    
+    case_metrics['p_guilty'] = case_metrics['guilty_votes'] / case_metrics['total_votes']
+    agreement = agreement_stats(total_votes, guilty_votes)
+    case_metrics['entropy'] = agreement['entropy']
+    case_metrics['margin'] = agreement['margin']
+    y_pred = (case_metrics['p_guilty'].to_numpy() > threshold).astype(np.int8)
+    case_metrics['prediction'] = np.where(y_pred == 1, 'guilty', 'innocent')
+    
+    case_ground_truth = {case['id']: case['ground_truth'] for case in cases}
+    
+    case_metrics['ground_truth'] = case_metrics.index.map(lambda x: case_ground_truth.get(x))
+    case_metrics['correct'] = case_metrics['prediction'] == case_metrics['ground_truth']
+    
+    # -1 marca casos sin verdad conocida
+    y_true = np.array(
+        [VERDICT_CODES.get(case_ground_truth.get(case_id), -1) for case_id in case_ids],
+        dtype=np.int8
+    )
+    
+    # Las métricas y la matriz de confusión cubren solo los casos con verdad conocida
+    known = y_true >= 0
+    y_true, y_pred = y_true[known], y_pred[known]
+    
+    try:
+        accuracy = accuracy_score(y_true, y_pred)
+        precision = precision_score(y_true, y_pred, zero_division=0)
+        recall = recall_score(y_true, y_pred, zero_division=0)
+        f1 = f1_score(y_true, y_pred, zero_division=0)
+    except:
+        accuracy = precision = recall = f1 = 0
+    
+    return {
+        'case_metrics': case_metrics,
+        'accuracy': accuracy,
+        'precision': precision,
+        'recall': recall,
+        'f1': f1,
+        'TN': int(np.sum((y_true == 0) & (y_pred == 0))),
+        'FP': int(np.sum((y_true == 0) & (y_pred == 1))),
+        'FN': int(np.sum((y_true == 1) & (y_pred == 0))),
+        'TP': int(np.sum((y_true == 1) & (y_pred == 1))),
+        'fleiss_kappa': agreement['fleiss_kappa'],
+        'krippendorff_alpha': agreement['krippendorff_alpha']
+    }
+
+def metrics_summary(results: dict) -> dict:
+    """Convierte el resultado de tally_metrics a tipos nativos de Python, serializables a JSON"""
+    summary = {}
+    for key, value in results.items():
+        if key == 'case_metrics':
+            continue
+        value = value.item() if isinstance(value, np.generic) else value
+        summary[key] = None if isinstance(value, float) and np.isnan(value) else value
+    summary['cases'] = json.loads(results['case_metrics'].reset_index().to_json(orient='records'))
+    return summary
+
+# HTML Generators
+def get_confusion_matrix_html(TN, FP, FN, TP):
+    """
+    Genera el HTML para una matriz de confusión con estilos
+    
+    Args:
+        TN: Número de verdaderos negativos
+        FP: Número de falsos positivos
+        FN: Número de falsos negativos
+        TP: Número de verdaderos positivos
+        
+    Returns:
+        str: HTML formateado para la matriz de confusión
+    """
+    matrix_html = f"""
+    <style>
+    .matrix-table {{
+      margin: 40px auto;
+      border-collapse: separate;
+      border-spacing: 8px;
+    }}
+    
+    .matrix-table th, .matrix-table td {{
+      text-align: center;
+      padding: 0;
+    }}
+    
+    .matrix-table th {{
+      font-weight: bold;
+      font-size: 16px;
+      padding: 8px;
+    }}
+    
+    .matrix-cell {{
+      width: 200px;
+      height: 200px;
+      padding: 15px !important;
+      vertical-align: middle;
+      border: 2px solid #ddd;
+    }}
+    
+    .tp-cell {{
+      background-color: #d4edda;
+    }}
+    
+    .tn-cell {{
+      background-color: #d4edda;
+    }}
+    
+    .fp-cell {{
+      background-color: #f8d7da;
+    }}
+    
+    .fn-cell {{
+      background-color: #f8d7da;
+    }}
+    
+    .matrix-label {{
+      font-weight: bold;
+      margin-bottom: 10px;
+      font-size: 15px;
+      display: block;
+    }}
+    
+    .matrix-value {{
+      font-size: 32px;
+      font-weight: bold;
+      margin: 10px 0;
+      display: block;
+    }}
+    
+    .matrix-description {{
+      font-size: 13px;
+      line-height: 1.3;
+      display: block;
+    }}
+    
+    .prediction-header {{
+      font-style: italic;
+      color: #444;
+    }}
+    
+    .rotate-text {{
+      writing-mode: vertical-lr;
+      transform: rotate(180deg);
+      height: 200px;
+    }}
+    </style>
+    
+    <table class="matrix-table">
+      <thead>
+        <tr>
+          <th></th>
+          <th colspan="2" class="prediction-header">Predicción</th>
+        </tr>
+        <tr>
+          <th></th>
+          <th>Inocente</th>
+          <th>Culpable</th>
+        </tr>
+      </thead>
+      <tbody>
+        <tr>
+          <th rowspan="2" class="rotate-text">Verdad</th>
+          <td class="matrix-cell tn-cell">
+            <span class="matrix-label">Verdadero Negativo (TN)</span>
+            <span class="matrix-value">{TN}</span>
+            <span class="matrix-description">Correctamente clasificado como Inocente</span>
+          </td>
+          <td class="matrix-cell fp-cell">
+            <span class="matrix-label">Falso Positivo (FP)</span>
+            <span class="matrix-value">{FP}</span>
+            <span class="matrix-description">Incorrectamente clasificado como Culpable</span>
+          </td>
+        </tr>
+        <tr>
+          <td class="matrix-cell fn-cell">
+            <span class="matrix-label">Falso Negativo (FN)</span>
+            <span class="matrix-value">{FN}</span>
+            <span class="matrix-description">Incorrectamente clasificado como Inocente</span>
+          </td>
+          <td class="matrix-cell tp-cell">
+            <span class="matrix-label">Verdadero Positivo (TP)</span>
+            <span class="matrix-value">{TP}</span>
+            <span class="matrix-description">Correctamente clasificado como Culpable</span>
+          </td>
+        </tr>
+      </tbody>
+    </table>
+    """
+    return matrix_html
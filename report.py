@@ -0,0 +1,212 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from archive import read_archive
+from metrics import count_votes, tally_metrics, metrics_summary, get_confusion_matrix_html
+
+# Umbrales evaluados en el barrido
+SWEEP_THRESHOLDS = np.round(np.arange(0, 1.0001, 0.05), 2)
+
+REPORT_FORMATS = ('json', 'csv', 'html')
+
+def open_readonly(db_path) -> sqlite3.Connection:
+    """Abre una base de datos de votos en modo solo lectura"""
+    uri = Path(db_path).resolve().as_uri() + "?mode=ro"
+    return sqlite3.connect(uri, uri=True)
+
+def iter_vote_chunks(conn: sqlite3.Connection, chunk_size: int = 10000):
+    """Genera los votos como bloques de arreglos (case_id, veredicto 0/1)"""
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(votes)")}
+    if 'username' in columns:
+        # Esquema anterior, con el veredicto como texto
+        query = (
+            "SELECT case_id, CASE verdict WHEN 'guilty' THEN 1 ELSE 0 END FROM votes "
+            "WHERE verdict IN ('guilty', 'innocent')"
+        )
+    else:
+        query = "SELECT case_id, verdict FROM votes"
+
+    c = conn.execute(query)
+    while True:
+        rows = c.fetchmany(chunk_size)
+        if not rows:
+            break
+        chunk = np.array(rows, dtype=np.int64)
+        yield chunk[:, 0], chunk[:, 1]
+
+def read_tallies(conn: sqlite3.Connection, chunk_size: int = 10000):
+    """Acumula los conteos por caso recorriendo los votos por bloques"""
+    parts = [count_votes(case_ids, verdicts) for case_ids, verdicts in iter_vote_chunks(conn, chunk_size)]
+    if not parts:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+
+    # Combinar los conteos parciales de cada bloque
+    case_ids, inverse = np.unique(np.concatenate([p[0] for p in parts]), return_inverse=True)
+    total_votes = np.bincount(inverse, weights=np.concatenate([p[1] for p in parts])).astype(np.int64)
+    guilty_votes = np.bincount(inverse, weights=np.concatenate([p[2] for p in parts])).astype(np.int64)
+    return case_ids, total_votes, guilty_votes
+
+def load_cases_file(path) -> list:
+    """Carga los casos desde un archivo JSON local"""
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+def read_archive_tallies(path):
+    """Cuenta los votos por caso de una sesión archivada en Parquet"""
+    table = read_archive(path, columns=['case_id', 'verdict'])
+    return count_votes(table['case_id'].to_numpy(), table['verdict'].to_numpy())
+
+def build_report(db_path, cases: list, threshold: float = 0.5, chunk_size: int = 10000) -> dict:
+    """Calcula el reporte completo de métricas de una base de datos de votos o sesión archivada"""
+    if Path(db_path).suffix == '.parquet':
+        case_ids, total_votes, guilty_votes = read_archive_tallies(db_path)
+    else:
+        conn = open_readonly(db_path)
+        try:
+            case_ids, total_votes, guilty_votes = read_tallies(conn, chunk_size)
+        finally:
+            conn.close()
+
+    results = tally_metrics(case_ids, total_votes, guilty_votes, cases, threshold)
+
+    sweep = []
+    for t in SWEEP_THRESHOLDS:
+        r = tally_metrics(case_ids, total_votes, guilty_votes, cases, float(t))
+        sweep.append({
+            'threshold': float(t),
+            **{k: r[k] for k in ('accuracy', 'precision', 'recall', 'f1', 'TN', 'FP', 'FN', 'TP')}
+        })
+
+    return {
+        'database': str(db_path),
+        'threshold': threshold,
+        'results': results,
+        'sweep': pd.DataFrame(sweep)
+    }
+
+def write_report(report: dict, output_dir, name: str, formats=REPORT_FORMATS) -> list:
+    """Escribe el reporte en los formatos indicados y devuelve las rutas generadas"""
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    results = report['results']
+    case_metrics = results['case_metrics']
+    sweep = report['sweep']
+    summary = metrics_summary(results)
+    written = []
+
+    if 'json' in formats:
+        path = output_dir / f"{name}.json"
+        data = {
+            'database': report['database'],
+            'threshold': report['threshold'],
+            **summary,
+            'sweep': json.loads(sweep.to_json(orient='records'))
+        }
+        path.write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding='utf-8')
+        written.append(path)
+
+    if 'csv' in formats:
+        path = output_dir / f"{name}_cases.csv"
+        case_metrics.to_csv(path)
+        written.append(path)
+        path = output_dir / f"{name}_sweep.csv"
+        sweep.to_csv(path, index=False)
+        written.append(path)
+
+    if 'html' in formats:
+        path = output_dir / f"{name}.html"
+        summary_df = pd.DataFrame([{
+            k: v for k, v in summary.items() if k not in ('cases', 'TN', 'FP', 'FN', 'TP')
+        }])
+        html = f"""<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>Reporte - {name}</title></head>
+<body>
+<h1>⚖️ Reporte del Juicio Interactivo</h1>
+<p><b>Base de datos:</b> {report['database']} | <b>Umbral:</b> {report['threshold']}</p>
+<h2>Métricas Globales</h2>
+{summary_df.to_html(index=False, float_format='%.3f')}
+<h2>Matriz de Confusión</h2>
+{get_confusion_matrix_html(results['TN'], results['FP'], results['FN'], results['TP'])}
+<h2>Resultados de Votación por Caso</h2>
+{case_metrics.to_html(float_format='%.3f')}
+<h2>Barrido de Umbrales</h2>
+{sweep.to_html(index=False, float_format='%.3f')}
+</body>
+</html>
+"""
+        path.write_text(html, encoding='utf-8')
+        written.append(path)
+
+    return written
+
+def process_database(job: tuple) -> list:
+    """Genera y escribe el reporte de una base de datos (ejecutable en un proceso aparte)"""
+    db_path, name, cases, threshold, chunk_size, output_dir, formats = job
+    report = build_report(db_path, cases, threshold, chunk_size)
+    return write_report(report, output_dir, name, formats)
+
+def _run_job(job: tuple):
+    """Ejecuta process_database capturando el error para reportarlo por base de datos"""
+    try:
+        return process_database(job), None
+    except Exception as e:
+        return [], str(e)
+
+def report_names(db_paths: list) -> list:
+    """Nombres de salida únicos; usa el directorio padre si los nombres de archivo se repiten"""
+    paths = [Path(p) for p in db_paths]
+    stems = [p.stem for p in paths]
+    return [
+        f"{p.parent.name}_{p.stem}" if stems.count(p.stem) > 1 else p.stem
+        for p in paths
+    ]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Genera el reporte de métricas a partir de una o más bases de datos de votos"
+    )
+    parser.add_argument("databases", nargs="+", help="Archivos votes.db o sesiones archivadas (.parquet) a procesar")
+    parser.add_argument("--cases", required=True, help="Archivo JSON con los casos")
+    parser.add_argument("--threshold", type=float, default=0.5, help="Umbral para veredicto de culpable")
+    parser.add_argument("--format", nargs="+", choices=REPORT_FORMATS, default=list(REPORT_FORMATS),
+                        dest="formats", help="Formatos de salida")
+    parser.add_argument("--output-dir", default="reports", help="Directorio de salida")
+    parser.add_argument("--chunk-size", type=int, default=10000, help="Votos leídos por bloque")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(),
+                        help="Procesos en paralelo al procesar varias bases de datos")
+    args = parser.parse_args(argv)
+
+    cases = load_cases_file(args.cases)
+    jobs = [
+        (db_path, name, cases, args.threshold, args.chunk_size, args.output_dir, args.formats)
+        for db_path, name in zip(args.databases, report_names(args.databases))
+    ]
+
+    if len(jobs) == 1 or args.jobs == 1:
+        outcomes = list(map(_run_job, jobs))
+    else:
+        with ProcessPoolExecutor(max_workers=args.jobs) as executor:
+            outcomes = list(executor.map(_run_job, jobs))
+
+    failed = False
+    for job, (written, error) in zip(jobs, outcomes):
+        if error:
+            failed = True
+            print(f"{job[0]}: error: {error}", file=sys.stderr)
+        else:
+            for path in written:
+                print(path)
+
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
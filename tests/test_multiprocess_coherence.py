@@ -0,0 +1,64 @@
+import multiprocessing
+import os
+import sys
+import traceback
+from pathlib import Path
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+
+N_WORKERS = 4
+TIMEOUT = 60
+
+def run_worker(worker_id, db_dir, barrier):
+    """Proceso de Streamlit simulado: lee con cachés calientes antes y después de que otro escriba"""
+    os.chdir(db_dir)
+    sys.path.insert(0, str(REPO_DIR))
+    import utils
+
+    # Calentar las cachés de configuración y votos
+    before = (utils.get_show_results_to_students(), len(utils.get_all_votes()))
+    barrier.wait(TIMEOUT)
+
+    if worker_id == 0:
+        assert utils.set_show_results_to_students(True)
+        assert utils.submit_vote("writer", 1, "guilty", "token-0")
+    barrier.wait(TIMEOUT)
+
+    after = (utils.get_show_results_to_students(), len(utils.get_all_votes()))
+    return before, after
+
+def worker(worker_id, db_dir, barrier, results):
+    """Envía el resultado del proceso, o su error, a la cola de resultados"""
+    try:
+        results.put((worker_id, run_worker(worker_id, db_dir, barrier), None))
+    except BaseException:
+        # Liberar a los demás procesos en lugar de dejarlos esperando en la barrera
+        barrier.abort()
+        results.put((worker_id, None, traceback.format_exc()))
+
+def test_workers_see_writes_from_other_process(tmp_path):
+    ctx = multiprocessing.get_context("spawn")
+    barrier = ctx.Barrier(N_WORKERS)
+    results = ctx.Queue()
+    processes = [
+        ctx.Process(target=worker, args=(i, str(tmp_path), barrier, results))
+        for i in range(N_WORKERS)
+    ]
+    for p in processes:
+        p.start()
+
+    outcomes, errors = {}, {}
+    for _ in processes:
+        wid, outcome, error = results.get(timeout=TIMEOUT)
+        outcomes[wid] = outcome
+        if error:
+            errors[wid] = error
+    assert not errors, "\n".join(f"worker {wid} failed:\n{error}" for wid, error in errors.items())
+    for p in processes:
+        p.join(TIMEOUT)
+        assert p.exitcode == 0
+
+    for wid in range(1, N_WORKERS):
+        before, after = outcomes[wid]
+        assert before == (False, 0)
+        assert after == (True, 1)
@@ -3,29 +3,71 @@ import sqlite3
 import requests
 import pandas as pd
 import numpy as np
-from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score
 from datetime import datetime
+import time
 import os
-import io
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
-# Database connection
-@st.cache_resource
-def get_db_connection():
-    conn = sqlite3.connect('votes.db', check_same_thread=False)
+from archive import archive_path, write_archive, read_archive_metrics, list_archives
+from cache import MemoCache
+from metrics import (
+    VERDICT_CODES, VERDICT_LABELS, count_votes, tally_metrics, metrics_summary,
+    get_confusion_matrix_html
+)
+
+# Versión del esquema, guardada en PRAGMA user_version
+SCHEMA_VERSION = 1
+
+# Archivo de la base de datos de votos
+DB_PATH = 'votes.db'
+
+# Cachés en memoria del proceso (configuración, agregados de votos e imágenes).
+# Las que dependen de la base de datos se invalidan cuando otro proceso escribe en ella.
+CONFIG_CACHE = MemoCache(version=lambda: get_data_version())
+VOTES_CACHE = MemoCache(version=lambda: get_data_version())
+IMAGE_CACHE = MemoCache()
+
+# Envíos de votos recientes por (token de sesión, usuario, caso), para agrupar repeticiones
+VOTE_COALESCE_WINDOW = 2.0
+RECENT_VOTES = {}
+RECENT_VOTES_LOCK = threading.Lock()
+
+def init_schema(conn: sqlite3.Connection):
+    """Crea las tablas y migra en sitio las bases de datos con el esquema anterior"""
     c = conn.cursor()
+    if c.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+        return
     
-    # Tabla de votos
+    # Todo el cambio de esquema ocurre en una sola transacción
+    c.execute("BEGIN IMMEDIATE")
+    legacy_columns = {row[1] for row in c.execute("PRAGMA table_info(votes)")}
+    is_legacy = 'username' in legacy_columns
+    if is_legacy:
+        c.execute("ALTER TABLE votes RENAME TO votes_legacy")
+    
+    # Tabla de usuarios (nombres internados)
     c.execute('''
-    CREATE TABLE IF NOT EXISTS votes (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT,
-        case_id INTEGER,
-        verdict TEXT,
-        ts TIMESTAMP,
-        UNIQUE(username, case_id)
+    CREATE TABLE IF NOT EXISTS users (
+        id INTEGER PRIMARY KEY,
+        username TEXT NOT NULL UNIQUE
     )
     ''')
     
+    # Tabla de votos: veredicto 0/1 y timestamp en segundos desde epoch
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS votes (
+        user_id INTEGER NOT NULL REFERENCES users(id),
+        case_id INTEGER NOT NULL,
+        verdict INTEGER NOT NULL CHECK (verdict IN (0, 1)),
+        ts INTEGER NOT NULL,
+        PRIMARY KEY (user_id, case_id)
+    ) WITHOUT ROWID
+    ''')
+    
+    # Índice cubriente para los agregados por caso
+    c.execute("CREATE INDEX IF NOT EXISTS idx_votes_case ON votes (case_id, verdict)")
+    
     # Tabla de configuración
     c.execute('''
     CREATE TABLE IF NOT EXISTS config (
@@ -35,9 +77,44 @@ def get_db_connection():
     )
     ''')
     
+    if is_legacy:
+        c.execute('''
+        INSERT OR IGNORE INTO users (username)
+        SELECT DISTINCT username FROM votes_legacy WHERE username IS NOT NULL
+        ''')
+        c.execute('''
+        INSERT OR REPLACE INTO votes (user_id, case_id, verdict, ts)
+        SELECT u.id, l.case_id, CASE l.verdict WHEN 'guilty' THEN 1 ELSE 0 END,
+               COALESCE(CAST(strftime('%s', l.ts, 'utc') AS INTEGER), 0)
+        FROM votes_legacy l JOIN users u ON u.username = l.username
+        WHERE l.verdict IN ('guilty', 'innocent')
+        ORDER BY l.id
+        ''')
+        c.execute("DROP TABLE votes_legacy")
+    
+    c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
     conn.commit()
+
+# Database connection
+@st.cache_resource
+def get_db_connection():
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=30)
+    # WAL permite que varios procesos lean mientras otro escribe
+    conn.execute("PRAGMA journal_mode=WAL")
+    init_schema(conn)
     return conn
 
+def get_data_version() -> int:
+    """
+    Obtiene el contador de cambios de la base de datos (PRAGMA data_version).
+    Cambia cuando otra conexión, p. ej. otro proceso de Streamlit, confirma una escritura.
+    """
+    return get_db_connection().execute("PRAGMA data_version").fetchone()[0]
+
+def checkpoint_db():
+    """Vuelca el WAL al archivo principal para que votes.db quede completo"""
+    get_db_connection().execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
 # Load cases data
 @st.cache_data(ttl=3600)
 def load_cases():
@@ -50,60 +127,155 @@ def load_cases():
         st.error(f"Error loading cases: {str(e)}")
         return []
 
+def get_case_index(cases: list) -> dict:
+    """Obtiene los casos indexados por su ID, a partir del mismo catálogo que usa la vista"""
+    return {case['id']: case for case in cases}
+
+def fetch_image(url: str) -> bytes:
+    """Descarga una imagen"""
+    response = requests.get(url, timeout=10)
+    response.raise_for_status()
+    return response.content
+
+def load_case_image(url: str):
+    """
+    Obtiene la imagen de un caso desde la caché, descargándola una sola vez.
+    Si la descarga falla, devuelve la URL para que la cargue el navegador; el fallo
+    no se guarda en caché, así que se reintenta en la siguiente carga.
+    """
+    try:
+        return IMAGE_CACHE.get(url, lambda: fetch_image(url))
+    except Exception:
+        return url
+
+def prefetch_images(urls: list, max_workers: int = 8):
+    """Descarga en paralelo las imágenes de los casos"""
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        list(executor.map(load_case_image, urls))
+
+@st.cache_resource(show_spinner=False)
+def warm_up() -> bool:
+    """
+    Precalienta las cachés una sola vez por proceso del servidor.
+    Las sesiones que llegan mientras tanto esperan a que termine en lugar de repetir el trabajo.
+    """
+    get_db_connection()
+    cases = load_cases()
+    get_show_results_to_students()
+    confusion_components()
+    
+    # Las imágenes se descargan en segundo plano
+    urls = [case['image'] for case in cases if case.get('image')]
+    threading.Thread(target=prefetch_images, args=(urls,), daemon=True).start()
+    return True
+
 # Database operations for votes
 def get_user_votes(username: str) -> set:
     """Obtiene el conjunto de IDs de casos en los que ha votado un usuario"""
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT case_id FROM votes WHERE username = ?", (username,))
+    c.execute(
+        "SELECT v.case_id FROM votes v JOIN users u ON u.id = v.user_id WHERE u.username = ?",
+        (username,)
+    )
     return set(row[0] for row in c.fetchall())
 
 def get_user_verdict(username: str, case_id: int) -> str:
     """Obtiene el veredicto actual de un usuario para un caso específico"""
     conn = get_db_connection()
     c = conn.cursor()
-    c.execute("SELECT verdict FROM votes WHERE username = ? AND case_id = ?", (username, case_id))
+    c.execute(
+        "SELECT v.verdict FROM votes v JOIN users u ON u.id = v.user_id "
+        "WHERE u.username = ? AND v.case_id = ?",
+        (username, case_id)
+    )
     result = c.fetchone()
-    return result[0] if result else None
+    return VERDICT_LABELS[result[0]] if result else None
 
-def save_vote(username: str, case_id: int, verdict: str) -> bool:
-    """Guarda un nuevo voto en la base de datos"""
-    conn = get_db_connection()
+def submit_vote(username: str, case_id: int, verdict: str, request_token: str):
+    """
+    Registra el voto de un usuario con un único upsert idempotente.
+    Los envíos idénticos repetidos por la misma sesión dentro de VOTE_COALESCE_WINDOW
+    segundos (doble clic, reruns) se descartan sin llegar a la base de datos.
+    
+    Args:
+        username: Nombre del usuario
+        case_id: ID del caso
+        verdict: 'guilty' o 'innocent'
+        request_token: Token de la sesión que envía el voto
+        
+    Returns:
+        bool: True si el voto cambió en la base de datos, False si ya estaba registrado,
+        None si hubo un error
+    """
+    key = (request_token, username, case_id)
+    now = time.monotonic()
+    with RECENT_VOTES_LOCK:
+        # Descartar envíos fuera de la ventana
+        for stale_key in [k for k, (_, ts) in RECENT_VOTES.items() if now - ts > VOTE_COALESCE_WINDOW]:
+            del RECENT_VOTES[stale_key]
+        recent = RECENT_VOTES.get(key)
+        if recent is not None and recent[0] == verdict:
+            return False
+    
+    # Conexión propia: un rollback en la compartida desharía escrituras de otras sesiones.
+    # La compartida se abre antes porque es la que crea el esquema.
+    get_db_connection()
+    conn = sqlite3.connect(DB_PATH, timeout=30)
     try:
         c = conn.cursor()
+        c.execute("INSERT OR IGNORE INTO users (username) VALUES (?)", (username,))
         c.execute(
-            "INSERT INTO votes (username, case_id, verdict, ts) VALUES (?, ?, ?, ?)",
-            (username, case_id, verdict, datetime.now())
+            "INSERT INTO votes (user_id, case_id, verdict, ts) "
+            "SELECT id, ?, ?, ? FROM users WHERE username = ? "
+            "ON CONFLICT (user_id, case_id) DO UPDATE SET verdict = excluded.verdict, ts = excluded.ts "
+            "WHERE verdict != excluded.verdict",
+            (case_id, VERDICT_CODES[verdict], int(time.time()), username)
         )
         conn.commit()
-        return True
-    except sqlite3.IntegrityError:
-        # Ya votó en este caso
-        return False
     except Exception as e:
-        st.error(f"Error saving vote: {str(e)}")
-        return False
+        conn.rollback()
+        st.error(f"Error al guardar el voto: {str(e)}")
+        return None
+    finally:
+        conn.close()
+    
+    with RECENT_VOTES_LOCK:
+        RECENT_VOTES[key] = (verdict, now)
+    
+    changed = c.rowcount > 0
+    if changed:
+        VOTES_CACHE.invalidate()
+    return changed
 
-def update_vote(username: str, case_id: int, verdict: str) -> bool:
-    """Actualiza un voto existente en la base de datos"""
-    conn = get_db_connection()
-    try:
-        c = conn.cursor()
-        c.execute(
-            "UPDATE votes SET verdict = ?, ts = ? WHERE username = ? AND case_id = ?",
-            (verdict, datetime.now(), username, case_id)
-        )
-        conn.commit()
-        return c.rowcount > 0  # True si se actualizó al menos un registro
-    except Exception as e:
-        st.error(f"Error al actualizar voto: {str(e)}")
-        return False
+def clear_recent_votes():
+    """Olvida los envíos recientes, para que un voto repetido tras borrar los votos se registre"""
+    with RECENT_VOTES_LOCK:
+        RECENT_VOTES.clear()
 
 def get_all_votes() -> pd.DataFrame:
-    """Obtiene todos los votos como un DataFrame"""
-    conn = get_db_connection()
-    query = "SELECT username, case_id, verdict, ts FROM votes"
-    return pd.read_sql_query(query, conn)
+    """
+    Obtiene todos los votos como un DataFrame (veredicto 0/1, ts en epoch).
+    El DataFrame se comparte entre sesiones hasta el siguiente voto: no debe modificarse.
+    """
+    def load():
+        conn = get_db_connection()
+        query = (
+            "SELECT u.username, v.case_id, v.verdict, v.ts "
+            "FROM votes v JOIN users u ON u.id = v.user_id"
+        )
+        return pd.read_sql_query(query, conn)
+    return VOTES_CACHE.get('all_votes', load)
+
+def get_vote_arrays():
+    """Obtiene los case_id y veredictos de todos los votos como arreglos enteros de NumPy"""
+    def load():
+        conn = get_db_connection()
+        c = conn.cursor()
+        c.execute("SELECT case_id, verdict FROM votes")
+        votes = np.fromiter(c, dtype=[('case_id', np.int64), ('verdict', np.int8)])
+        return votes['case_id'], votes['verdict']
+    return VOTES_CACHE.get('vote_arrays', load)
 
 def reset_all_votes():
     """Elimina todos los votos de la base de datos"""
@@ -111,15 +283,89 @@ def reset_all_votes():
     c = conn.cursor()
     c.execute("DELETE FROM votes")
     conn.commit()
+    VOTES_CACHE.invalidate()
+    clear_recent_votes()
+
+def archive_session(name: str, threshold: float = 0.5):
+    """
+    Archiva los votos y las métricas finales de la sesión en un archivo Parquet,
+    y luego vacía y compacta (VACUUM) la base de datos
+    
+    Returns:
+        Path: Ruta del archivo creado, o None si hubo un error
+    """
+    # Conexión propia: la compartida la usan a la vez las demás sesiones del proceso,
+    # y sus commits cerrarían esta transacción antes de tiempo
+    conn = sqlite3.connect(DB_PATH, timeout=30)
+    path = None
+    try:
+        # Fuera del bloqueo: cargar los casos puede requerir una descarga
+        target = archive_path(name)
+        cases = load_cases()
+        
+        c = conn.cursor()
+        # Bloquear escrituras para no perder votos entre la lectura y el borrado
+        c.execute("BEGIN IMMEDIATE")
+        votes = pd.read_sql_query(
+            "SELECT u.username, v.case_id, v.verdict, v.ts "
+            "FROM votes v JOIN users u ON u.id = v.user_id",
+            conn
+        )
+        case_ids, total_votes, guilty_votes = count_votes(votes['case_id'].to_numpy(), votes['verdict'].to_numpy())
+        results = tally_metrics(case_ids, total_votes, guilty_votes, cases, threshold)
+        metrics = {
+            'session': name,
+            'archived_at': int(time.time()),
+            'threshold': threshold,
+            **metrics_summary(results)
+        }
+        path = write_archive(target, votes, metrics)
+        c.execute("DELETE FROM votes")
+        c.execute("DELETE FROM users")
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        conn.close()
+        # Los votos siguen en la base de datos: no dejar un archivo que los duplique
+        if path is not None:
+            path.unlink()
+        st.error(f"Error al archivar la sesión: {str(e)}")
+        return None
+    
+    VOTES_CACHE.invalidate()
+    clear_recent_votes()
+    try:
+        conn.execute("VACUUM")
+    except sqlite3.OperationalError as e:
+        st.warning(f"Sesión archivada, pero no se pudo compactar la base de datos: {str(e)}")
+    finally:
+        conn.close()
+    return path
+
+def get_archived_sessions() -> pd.DataFrame:
+    """Obtiene las métricas finales de las sesiones archivadas (solo lee los metadatos)"""
+    rows = []
+    for path in list_archives():
+        metrics = read_archive_metrics(path)
+        rows.append({
+            'session': metrics.get('session', path.stem),
+            'archived_at': pd.to_datetime(metrics.get('archived_at'), unit='s'),
+            'votes': sum(case['total_votes'] for case in metrics.get('cases', [])),
+            **{k: metrics.get(k) for k in ('threshold', 'accuracy', 'precision', 'recall', 'f1')}
+        })
+    return pd.DataFrame(rows)
 
 # Database operations for config
 def get_config(key: str, default_value: str = None) -> str:
     """Obtiene un valor de configuración por su clave"""
-    conn = get_db_connection()
-    c = conn.cursor()
-    c.execute("SELECT value FROM config WHERE key = ?", (key,))
-    result = c.fetchone()
-    return result[0] if result else default_value
+    def load():
+        conn = get_db_connection()
+        c = conn.cursor()
+        c.execute("SELECT value FROM config WHERE key = ?", (key,))
+        result = c.fetchone()
+        return result[0] if result else None
+    value = CONFIG_CACHE.get(key, load)
+    return value if value is not None else default_value
 
 def set_config(key: str, value: str) -> bool:
     """Establece un valor de configuración"""
@@ -131,6 +377,7 @@ def set_config(key: str, value: str) -> bool:
             (key, value, datetime.now())
         )
         conn.commit()
+        CONFIG_CACHE.invalidate()
         return True
     except Exception as e:
         st.error(f"Error al guardar configuración: {str(e)}")
@@ -146,178 +393,17 @@ def set_show_results_to_students(value: bool) -> bool:
     return set_config("show_results_to_students", str(value).lower())
 
 # Analytics and Metrics
-def confusion_components(df: pd.DataFrame, threshold: float = 0.5):
-    """Calcula las métricas de confusión y componentes para análisis"""
-    if df.empty:
-        return {
-            'case_metrics': pd.DataFrame(),
-            'accuracy': 0,
-            'precision': 0,
-            'recall': 0,
-            'f1': 0
-        }
-        
-    case_metrics = df.groupby('case_id').agg(
-        total_votes=('verdict', 'count'),
-        guilty_votes=('verdict', lambda x: (x == 'guilty').sum())
-    )
-    
-    case_metrics['p_guilty'] = case_metrics['guilty_votes'] / case_metrics['total_votes']
-    case_metrics['prediction'] = (case_metrics['p_guilty'] > threshold).map({True: 'guilty', False: 'innocent'})
-    
-    cases = load_cases()
-    case_ground_truth = {case['id']: case['ground_truth'] for case in cases}
-    
-    case_metrics['ground_truth'] = case_metrics.index.map(lambda x: case_ground_truth.get(x))
-    case_metrics['correct'] = case_metrics['prediction'] == case_metrics['ground_truth']
-    
-    y_true = case_metrics['ground_truth'].map({'guilty': 1, 'innocent': 0}).values
-    y_pred = case_metrics['prediction'].map({'guilty': 1, 'innocent': 0}).values
-    
-    try:
-        accuracy = accuracy_score(y_true, y_pred)
-        precision = precision_score(y_true, y_pred, zero_division=0)
-        recall = recall_score(y_true, y_pred, zero_division=0)
-        f1 = f1_score(y_true, y_pred, zero_division=0)
-    except:
-        accuracy = precision = recall = f1 = 0
-    
-    return {
-        'case_metrics': case_metrics,
-        'accuracy': accuracy,
-        'precision': precision,
-        'recall': recall,
-        'f1': f1
-    }
-
-# HTML Generators
-def get_confusion_matrix_html(TN, FP, FN, TP):
-    """
-    Genera el HTML para una matriz de confusión con estilos
-    
-    Args:
-        TN: Número de verdaderos negativos
-        FP: Número de falsos positivos
-        FN: Número de falsos negativos
-        TP: Número de verdaderos positivos
-        
-    Returns:
-        str: HTML formateado para la matriz de confusión
+def confusion_components(threshold: float = 0.5):
     """
-    matrix_html = f"""
-    <style>
-    .matrix-table {{
-      margin: 40px auto;
-      border-collapse: separate;
-      border-spacing: 8px;
-    }}
-    
-    .matrix-table th, .matrix-table td {{
-      text-align: center;
-      padding: 0;
-    }}
-    
-    .matrix-table th {{
-      font-weight: bold;
-      font-size: 16px;
-      padding: 8px;
-    }}
-    
-    .matrix-cell {{
-      width: 200px;
-      height: 200px;
-      padding: 15px !important;
-      vertical-align: middle;
-      border: 2px solid #ddd;
-    }}
-    
-    .tp-cell {{
-      background-color: #d4edda;
-    }}
-    
-    .tn-cell {{
-      background-color: #d4edda;
-    }}
-    
-    .fp-cell {{
-      background-color: #f8d7da;
-    }}
-    
-    .fn-cell {{
-      background-color: #f8d7da;
-    }}
-    
-    .matrix-label {{
-      font-weight: bold;
-      margin-bottom: 10px;
-      font-size: 15px;
-      display: block;
-    }}
-    
-    .matrix-value {{
-      font-size: 32px;
-      font-weight: bold;
-      margin: 10px 0;
-      display: block;
-    }}
-    
-    .matrix-description {{
-      font-size: 13px;
-      line-height: 1.3;
-      display: block;
-    }}
-    
-    .prediction-header {{
-      font-style: italic;
-      color: #444;
-    }}
-    
-    .rotate-text {{
-      writing-mode: vertical-lr;
-      transform: rotate(180deg);
-      height: 200px;
-    }}
-    </style>
-    
-    <table class="matrix-table">
-      <thead>
-        <tr>
-          <th></th>
-          <th colspan="2" class="prediction-header">Predicción</th>
-        </tr>
-        <tr>
-          <th></th>
-          <th>Inocente</th>
-          <th>Culpable</th>
-        </tr>
-      </thead>
-      <tbody>
-        <tr>
-          <th rowspan="2" class="rotate-text">Verdad</th>
-          <td class="matrix-cell tn-cell">
-            <span class="matrix-label">Verdadero Negativo (TN)</span>
-            <span class="matrix-value">{TN}</span>
-            <span class="matrix-description">Correctamente clasificado como Inocente</span>
-          </td>
-          <td class="matrix-cell fp-cell">
-            <span class="matrix-label">Falso Positivo (FP)</span>
-            <span class="matrix-value">{FP}</span>
-            <span class="matrix-description">Incorrectamente clasificado como Culpable</span>
-          </td>
-        </tr>
-        <tr>
-          <td class="matrix-cell fn-cell">
-            <span class="matrix-label">Falso Negativo (FN)</span>
-            <span class="matrix-value">{FN}</span>
-            <span class="matrix-description">Incorrectamente clasificado como Inocente</span>
-          </td>
-          <td class="matrix-cell tp-cell">
-            <span class="matrix-label">Verdadero Positivo (TP)</span>
-            <span class="matrix-value">{TP}</span>
-            <span class="matrix-description">Correctamente clasificado como Culpable</span>
-          </td>
-        </tr>
-      </tbody>
-    </table>
+    Calcula las métricas de confusión y componentes para análisis.
+    El resultado se comparte entre sesiones hasta el siguiente voto: no debe modificarse.
     """
-    return matrix_html
\ No newline at end of file
+    def compute():
+        case_ids, verdicts = get_vote_arrays()
+        if case_ids.size == 0:
+            return tally_metrics([], [], [], [], threshold)
+        
+        # Conteos por caso sobre los arreglos enteros (veredicto 0/1)
+        case_ids, total_votes, guilty_votes = count_votes(case_ids, verdicts)
+        return tally_metrics(case_ids, total_votes, guilty_votes, load_cases(), threshold)
+    return VOTES_CACHE.get(('metrics', threshold), compute)
@@ -5,10 +5,10 @@ from datetime import datetime
 
 # Importar funciones de utilidad
 from utils import (
-    get_db_connection, load_cases, get_user_votes, get_user_verdict, 
-    save_vote, update_vote, get_all_votes, reset_all_votes,
+    get_db_connection, checkpoint_db, load_cases, get_case_index, load_case_image, get_user_votes, get_user_verdict, 
+    submit_vote, get_all_votes, get_vote_arrays, reset_all_votes, archive_session, get_archived_sessions,
     get_config, set_config, get_show_results_to_students, set_show_results_to_students,
-    confusion_components, get_confusion_matrix_html
+    confusion_components, get_confusion_matrix_html, VERDICT_LABELS
 )
 
 def render_login_view():
@@ -89,16 +89,21 @@ def render_case_view(cases):
         st.markdown(f"### Caso #{case_id}")
         
         if "image" in case and case["image"]:
-            st.image(case["image"], caption=f"Acusado - Caso #{case_id}")
+            st.image(load_case_image(case["image"]), caption=f"Acusado - Caso #{case_id}")
         
         st.markdown(f"**Descripción:**\n{case['description']}")
         
-        already_voted = case_id in voted_cases
         current_verdict = None
         
         # Obtener el veredicto actual si ya votó
-        if already_voted:
+        if case_id in voted_cases:
             current_verdict = get_user_verdict(username, case_id)
+            # El voto pudo borrarse (reinicio o archivo de la sesión) desde otra sesión
+            if current_verdict is None:
+                voted_cases.discard(case_id)
+        already_voted = current_verdict is not None
+        
+        if already_voted:
             st.info(f"Tu veredicto actual: **{current_verdict.upper()}**. Puedes cambiar tu decisión si lo deseas.")
         
         # Botones de votación (se resaltan según el veredicto actual)
@@ -117,33 +122,18 @@ def render_case_view(cases):
                 type="primary" if current_verdict == "innocent" else "secondary"
             )
             
-        # Procesar voto nuevo o actualización
-        if guilty_button:
-            if already_voted:
-                if current_verdict != "guilty":
-                    if update_vote(username, case_id, "guilty"):
-                        st.success("Voto actualizado: CULPABLE")
-                        st.rerun()
-                    else:
-                        st.error("No se pudo actualizar el voto")
-            else:
-                if save_vote(username, case_id, "guilty"):
-                    st.session_state["voted_cases"].add(case_id)
-                    st.success("Voto registrado: CULPABLE")
-                    st.rerun()
-            
-        if innocent_button:
-            if already_voted:
-                if current_verdict != "innocent":
-                    if update_vote(username, case_id, "innocent"):
-                        st.success("Voto actualizado: INOCENTE")
-                        st.rerun()
-                    else:
-                        st.error("No se pudo actualizar el voto")
+        # Procesar voto: un único upsert idempotente para votos nuevos y cambios
+        verdict = "guilty" if guilty_button else "innocent" if innocent_button else None
+        if verdict:
+            changed = submit_vote(username, case_id, verdict, st.session_state["vote_token"])
+            if changed is None:
+                st.error("No se pudo registrar el voto")
             else:
-                if save_vote(username, case_id, "innocent"):
-                    st.session_state["voted_cases"].add(case_id)
-                    st.success("Voto registrado: INOCENTE")
+                st.session_state["voted_cases"].add(case_id)
+                # Solo recargar si cambió lo que se muestra
+                if changed or verdict != current_verdict:
+                    label = "CULPABLE" if verdict == "guilty" else "INOCENTE"
+                    st.success(f"Voto {'actualizado' if already_voted else 'registrado'}: {label}")
                     st.rerun()
         
         # Navegación entre casos
@@ -183,15 +173,16 @@ def render_results_view(cases, threshold=0.5):
     username = st.session_state["username"]
     st.markdown(f"**Usuario:** {username}")
     
-    votes_df = get_all_votes()
+    # Calcular métricas con el umbral predeterminado
+    results = confusion_components(threshold)
+    case_metrics = results['case_metrics']
     
-    if votes_df.empty:
+    if case_metrics.empty:
         st.warning("No hay votos registrados aún.")
         return
     
-    # Calcular métricas con el umbral predeterminado
-    results = confusion_components(votes_df, threshold)
-    case_metrics = results['case_metrics']
+    # Votos con nombre de usuario, solo para mostrar el voto propio
+    votes_df = get_all_votes()
     
     # Mostrar métricas globales
     st.markdown("## Métricas Globales")
@@ -204,24 +195,14 @@ def render_results_view(cases, threshold=0.5):
     # Matriz de confusión
     st.markdown("## Matriz de Confusión")
     
-    # Calcular los valores de la matriz
-    y_true = case_metrics['ground_truth'].map({'guilty': 1, 'innocent': 0}).values
-    y_pred = case_metrics['prediction'].map({'guilty': 1, 'innocent': 0}).values
-    
-    # Calcular componentes de la matriz de confusión
-    TP = sum((y_true == 1) & (y_pred == 1))
-    FP = sum((y_true == 0) & (y_pred == 1))
-    FN = sum((y_true == 1) & (y_pred == 0))
-    TN = sum((y_true == 0) & (y_pred == 0))
-    
     # Obtener y mostrar la matriz de confusión
-    matrix_html = get_confusion_matrix_html(TN, FP, FN, TP)
+    matrix_html = get_confusion_matrix_html(results['TN'], results['FP'], results['FN'], results['TP'])
     st.markdown(matrix_html, unsafe_allow_html=True)
     
     # Mostrar resultados por caso
     st.markdown("## Resultados de Votación por Caso")
     
-    case_dict = {case['id']: case for case in cases}
+    case_dict = get_case_index(cases)
     
     for case_id, metrics in case_metrics.iterrows():
         if case_id not in case_dict:
@@ -235,14 +216,14 @@ def render_results_view(cases, threshold=0.5):
         if not user_votes.empty:
             case_vote = user_votes[user_votes['case_id'] == case_id]
             if not case_vote.empty:
-                user_vote = case_vote['verdict'].iloc[0]
+                user_vote = VERDICT_LABELS[case_vote['verdict'].iloc[0]]
         
         with st.expander(f"Caso #{case_id} - {metrics['correct'] and '✅ Correcto' or '❌ Incorrecto'}"):
             col1, col2 = st.columns([1, 2])
             
             with col1:
                 if "image" in case and case["image"]:
-                    st.image(case["image"], caption=f"Acusado - Caso #{case_id}")
+                    st.image(load_case_image(case["image"]), caption=f"Acusado - Caso #{case_id}")
             
             with col2:
                 st.markdown(f"**Descripción:** {case['description']}")
@@ -262,13 +243,57 @@ def render_results_view(cases, threshold=0.5):
                     'Inocente': [metrics['total_votes'] - metrics['guilty_votes']]
                 })
 
+def render_archive_section(has_votes: bool):
+    """Renderiza el archivo de sesiones: guarda votos y métricas en Parquet y vacía la base de datos"""
+    st.markdown("## Sesiones")
+    
+    # Inicializar estado para el proceso de archivo
+    if "archive_step" not in st.session_state:
+        st.session_state["archive_step"] = 0
+    
+    # Paso 1: Mostrar botón inicial
+    if st.session_state["archive_step"] == 0:
+        if st.button("Archivar Sesión", disabled=not has_votes):
+            st.session_state["archive_step"] = 1
+            st.rerun()
+    
+    # Paso 2: Pedir nombre y confirmación
+    elif st.session_state["archive_step"] == 1:
+        st.warning("Los votos se guardarán en un archivo y se eliminarán de la base de datos.")
+        session_name = st.text_input("Nombre de la sesión", value=datetime.now().strftime("%Y-%m-%d"))
+        confirm = st.checkbox("Confirmo que quiero archivar la sesión y vaciar los votos")
+        
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("Cancelar", key="archive_cancel"):
+                st.session_state["archive_step"] = 0
+                st.rerun()
+        
+        with col2:
+            if st.button("SÍ, archivar", type="primary", disabled=not confirm):
+                if confirm:
+                    # Umbral elegido en el panel (0.5 si aún no se ha mostrado)
+                    threshold = st.session_state.get("threshold", 0.5)
+                    if archive_session(session_name, threshold):
+                        st.session_state["archive_step"] = 0
+                        st.success(f"Sesión {session_name} archivada")
+                        st.rerun()
+    
+    archived = get_archived_sessions()
+    if not archived.empty:
+        st.markdown("**Sesiones archivadas**")
+        st.dataframe(archived, hide_index=True)
+
 def render_admin_view(cases):
     """Renderiza la vista de administración"""
     st.title("⚖️ Panel de Administración")
     
-    votes_df = get_all_votes()
+    case_ids, _ = get_vote_arrays()
+    
+    # Las sesiones archivadas se muestran aunque la base de datos esté vacía
+    render_archive_section(has_votes=case_ids.size > 0)
     
-    if votes_df.empty:
+    if case_ids.size == 0:
         st.warning("No hay votos registrados aún")
         return
     
@@ -281,7 +306,8 @@ def render_admin_view(cases):
         min_value=0.0, 
         max_value=1.0, 
         value=0.5,
-        step=0.05
+        step=0.05,
+        key="threshold"
     )
     
     # Opción para permitir a los estudiantes ver los resultados
@@ -302,10 +328,10 @@ def render_admin_view(cases):
             st.error("No se pudo actualizar la configuración.")
     
     # Calcular métricas
-    results = confusion_components(votes_df, threshold)
+    results = confusion_components(threshold)
     case_metrics = results['case_metrics']
     
-    case_dict = {case['id']: case for case in cases}
+    case_dict = get_case_index(cases)
     
     for case_id, metrics in case_metrics.iterrows():
         if case_id not in case_dict:
@@ -318,7 +344,7 @@ def render_admin_view(cases):
             
             with col1:
                 if "image" in case and case["image"]:
-                    st.image(case["image"], caption=f"Acusado - Caso #{case_id}")
+                    st.image(load_case_image(case["image"]), caption=f"Acusado - Caso #{case_id}")
             
             with col2:
                 st.markdown(f"**Descripción:** {case['description']}")
@@ -328,6 +354,7 @@ def render_admin_view(cases):
                 st.markdown(f"**Total de Votos:** {metrics['total_votes']}")
                 st.markdown(f"**Votos Culpable:** {metrics['guilty_votes']}")
                 st.markdown(f"**Votos Inocente:** {metrics['total_votes'] - metrics['guilty_votes']}")
+                st.markdown(f"**Entropía:** {metrics['entropy']:.2f} | **Margen:** {metrics['margin']:.2f}")
                 
                 st.bar_chart({
                     'Culpable': [metrics['guilty_votes']],
@@ -346,26 +373,27 @@ def render_admin_view(cases):
     col3.metric("Recall", f"{results['recall']:.2f}")
     col4.metric("F1 Score", f"{results['f1']:.2f}")
     
-    # Matriz de confusión
-    st.markdown("### Matriz de Confusión")
+    # Acuerdo entre los miembros del jurado
+    st.markdown("### Acuerdo del Jurado")
+    col1, col2 = st.columns(2)
+    col1.metric("Kappa de Fleiss", f"{results['fleiss_kappa']:.2f}")
+    col2.metric("Alfa de Krippendorff", f"{results['krippendorff_alpha']:.2f}")
     
-    # Calcular los valores de la matriz
-    y_true = case_metrics['ground_truth'].map({'guilty': 1, 'innocent': 0}).values
-    y_pred = case_metrics['prediction'].map({'guilty': 1, 'innocent': 0}).values
+    st.markdown("**Casos más disputados**")
+    contested = case_metrics.sort_values('entropy', ascending=False).head(5)
+    st.dataframe(contested[['total_votes', 'guilty_votes', 'p_guilty', 'entropy', 'margin']])
     
-    # Calcular componentes de la matriz de confusión
-    TP = sum((y_true == 1) & (y_pred == 1))
-    FP = sum((y_true == 0) & (y_pred == 1))
-    FN = sum((y_true == 1) & (y_pred == 0))
-    TN = sum((y_true == 0) & (y_pred == 0))
+    # Matriz de confusión
+    st.markdown("### Matriz de Confusión")
     
     # Obtener y mostrar la matriz de confusión
-    matrix_html = get_confusion_matrix_html(TN, FP, FN, TP)
+    matrix_html = get_confusion_matrix_html(results['TN'], results['FP'], results['FN'], results['TP'])
     st.markdown(matrix_html, unsafe_allow_html=True)
     
     # Opciones de administración
     st.markdown("### Herramientas de Administración")
     if st.button("Descargar votes.db"):
+        checkpoint_db()
         with open('votes.db', 'rb') as f:
             bytes_data = f.read()
         st.download_button(